@@ -1,16 +1,21 @@
+import asyncio
+import json
 import logging
-import requests
+import httpx
 import jdatetime
+import orjson
 import os
+import re
 import time
 import sqlite3
 from dotenv import load_dotenv
+from collections import OrderedDict
 from datetime import date, timedelta
-from functools import wraps
+from functools import lru_cache, wraps
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 from telegram.constants import ChatType
-from telegram.error import BadRequest, Forbidden
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
 
 # ---- Version : 3.0.4 : Re-implemented sticky video feature using environment variables.
 
@@ -20,17 +25,44 @@ load_dotenv()
 # --- CONFIGURATION ---
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 API_BASE_URL = 'http://arsestennis.ir/reservations/api/'
-ADMIN_IDS = [int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id]
+API_URL_FMT = API_BASE_URL + '?date={}'
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+ADMIN_IDS = frozenset(int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id)
 GROUP_VIDEO_FILE_ID = os.getenv('GROUP_VIDEO_FILE_ID') # For the sticky video
+PUBLIC_URL = os.getenv('PUBLIC_URL') # Base URL for webhook delivery; falls back to polling if unset
+WEBHOOK_PORT = int(os.getenv('PORT', 8443))
 
 MANAGER_NAME = "مدیریت (آقای آرسس)"
 MANAGER_PHONE = "09155518828"
 STAFF_NAME = "مسئول مجموعه (آقای افتخاری)"
 STAFF_PHONE = "09306437158"
 
+_STAFF_TEL = f"+98{STAFF_PHONE[1:]}"
+_MANAGER_TEL = f"+98{MANAGER_PHONE[1:]}"
+_CONTACT_BLOCK = (
+    "📞 **تماس جهت هماهنگی:**\n"
+    f"▪️ **{STAFF_NAME}:** [{STAFF_PHONE}](tel:{_STAFF_TEL})\n"
+    f"▪️ **{MANAGER_NAME}:** [{MANAGER_PHONE}](tel:{_MANAGER_TEL})"
+)
+
 BUTTON_COOLDOWN_SECONDS = 5
 DB_FILE = 'bot_state.db'
 AUTO_UPDATE_INTERVAL_SECONDS = 300 # 5 minutes
+AUTO_UPDATE_MINUTES = AUTO_UPDATE_INTERVAL_SECONDS // 60
+
+# Message templates assembled once; only the variable part is formatted per call.
+_UPDATE_INFO_TEMPLATE = f"*(بروزرسانی خودکار هر {AUTO_UPDATE_MINUTES} دقیقه - آخرین آپدیت: {{}})*\n\n"
+_GROUP_WELCOME_TEMPLATE = (
+    "🎾 **آکادمی تنیس آرسس (بروزرسانی {})**\n\n"
+    "به گروه اطلاع‌رسانی تایم‌های آزاد خوش آمدید.\n\n"
+    f"👇 **مهم:** لیست تایم‌ها در پیام زیر به صورت خودکار هر **{AUTO_UPDATE_MINUTES} دقیقه** بروزرسانی می‌شود.\n\n"
+    "🌐 **وب‌سایت:** [arsestennis.ir](http://arsestennis.ir)\n"
+    "📅 **رزرو آنلاین:** [arsestennis.ir/reservations/reserve-for-today](http://arsestennis.ir/reservations/reserve-for-today/)\n\n"
+    f"{_CONTACT_BLOCK}"
+)
+
+# Shared async HTTP client (created in post_init so it lives on the bot's event loop).
+HTTPX_CLIENT: httpx.AsyncClient | None = None
 
 # --- LOGGING SETUP ---
 logging.basicConfig(
@@ -41,70 +73,74 @@ logger = logging.getLogger(__name__)
 
 
 # --- DATABASE MANAGEMENT ---
+# Single long-lived connection, created lazily. PTB runs all handlers on one
+# asyncio loop so no locking is needed; autocommit (isolation_level=None)
+# keeps each statement durable without explicit commit calls.
+_DB: sqlite3.Connection | None = None
+
+def _db() -> sqlite3.Connection:
+    global _DB
+    if _DB is None:
+        _DB = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+        # journal_mode persists in the DB file; the rest are per-connection.
+        _DB.execute("PRAGMA journal_mode=WAL")
+        _DB.execute("PRAGMA synchronous=NORMAL")
+        _DB.execute("PRAGMA temp_store=MEMORY")
+        _DB.execute("PRAGMA cache_size=-8000")
+        _DB.execute("PRAGMA busy_timeout=5000")
+    return _DB
+
+def _ensure_table(con: sqlite3.Connection, name: str, ddl: str):
+    """Creates the table, migrating pre-WITHOUT ROWID DBs in place."""
+    row = con.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name = ?", (name,)).fetchone()
+    if row is None:
+        con.execute(ddl)
+    elif 'WITHOUT ROWID' not in row[0].upper():
+        con.execute("BEGIN")
+        con.execute(f"ALTER TABLE {name} RENAME TO {name}_old")
+        con.execute(ddl)
+        con.execute(f"INSERT INTO {name} SELECT * FROM {name}_old")
+        con.execute(f"DROP TABLE {name}_old")
+        con.execute("COMMIT")
+        logger.info(f"Migrated table '{name}' to WITHOUT ROWID.")
+
 def init_db():
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    cur.execute('''CREATE TABLE IF NOT EXISTS group_schedules (chat_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL)''')
-    cur.execute('''CREATE TABLE IF NOT EXISTS button_cooldowns (chat_id INTEGER PRIMARY KEY, last_used_timestamp REAL NOT NULL)''')
-    cur.execute('''CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL)''')
-    cur.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('updates_clicked', 0)")
-    cur.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('auto_updates_processed', 0)")
-    con.commit()
-    con.close()
+    con = _db()
+    _ensure_table(con, 'group_schedules',
+                  'CREATE TABLE group_schedules (chat_id INTEGER PRIMARY KEY, message_id INTEGER NOT NULL) WITHOUT ROWID')
+    _ensure_table(con, 'stats',
+                  'CREATE TABLE stats (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID')
+    con.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('updates_clicked', 0)")
+    con.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('auto_updates_processed', 0)")
     logger.info(f"Database '{DB_FILE}' initialized successfully.")
 
 def db_set_schedule_message(chat_id: int, message_id: int):
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    cur.execute("INSERT OR REPLACE INTO group_schedules (chat_id, message_id) VALUES (?, ?)", (chat_id, message_id))
-    con.commit()
-    con.close()
+    _db().execute("INSERT OR REPLACE INTO group_schedules (chat_id, message_id) VALUES (?, ?)", (chat_id, message_id))
 def db_get_schedule_message(chat_id: int) -> int | None:
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    res = cur.execute("SELECT message_id FROM group_schedules WHERE chat_id = ?", (chat_id,))
-    result = res.fetchone()
-    con.close()
+    result = _db().execute("SELECT message_id FROM group_schedules WHERE chat_id = ?", (chat_id,)).fetchone()
     return result[0] if result else None
 def db_remove_schedule_message(chat_id: int):
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    cur.execute("DELETE FROM group_schedules WHERE chat_id = ?", (chat_id,))
-    con.commit()
-    con.close()
-def db_get_cooldown(chat_id: int) -> float:
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    res = cur.execute("SELECT last_used_timestamp FROM button_cooldowns WHERE chat_id = ?", (chat_id,))
-    result = res.fetchone()
-    con.close()
-    return result[0] if result else 0.0
-def db_set_cooldown(chat_id: int, timestamp: float):
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    cur.execute("INSERT OR REPLACE INTO button_cooldowns (chat_id, last_used_timestamp) VALUES (?, ?)", (chat_id, timestamp))
-    con.commit()
-    con.close()
+    _db().execute("DELETE FROM group_schedules WHERE chat_id = ?", (chat_id,))
+def db_remove_schedule_messages(chat_ids: list[int]):
+    if not chat_ids:
+        return
+    con = _db()
+    con.execute("BEGIN")
+    con.executemany("DELETE FROM group_schedules WHERE chat_id = ?", [(chat_id,) for chat_id in chat_ids])
+    con.execute("COMMIT")
 def db_increment_stat(key: str):
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    cur.execute("UPDATE stats SET value = value + 1 WHERE key = ?", (key,))
-    con.commit()
-    con.close()
+    _db().execute("UPDATE stats SET value = value + 1 WHERE key = ?", (key,))
+def db_add_stat(key: str, amount: int):
+    if amount:
+        _db().execute("UPDATE stats SET value = value + ? WHERE key = ?", (amount, key))
 def db_get_stat(key: str) -> int:
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    res = cur.execute("SELECT value FROM stats WHERE key = ?", (key,))
-    result = res.fetchone()
-    con.close()
+    result = _db().execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()
     return result[0] if result else 0
 def db_get_all_active_groups() -> list[int]:
-    con = sqlite3.connect(DB_FILE)
-    cur = con.cursor()
-    res = cur.execute("SELECT chat_id FROM group_schedules")
-    results = res.fetchall()
-    con.close()
+    results = _db().execute("SELECT chat_id FROM group_schedules").fetchall()
     return [row[0] for row in results]
+def db_get_all_schedules() -> list[tuple[int, int]]:
+    return _db().execute("SELECT chat_id, message_id FROM group_schedules").fetchall()
 
 # --- ADMIN DECORATOR ---
 def admin_only(func):
@@ -119,73 +155,177 @@ def admin_only(func):
     return wrapped
 
 # --- HELPER & CORE FUNCTIONS ---
-PERSIAN_WEEKDAYS = {"Saturday": "شنبه", "Sunday": "یکشنبه", "Monday": "دوشنبه", "Tuesday": "سه‌شنبه", "Wednesday": "چهارشنبه", "Thursday": "پنجشنبه", "Friday": "جمعه"}
+# Persian weekday names indexed by date.weekday() (Monday=0 ... Sunday=6).
+PERSIAN_WEEKDAYS_BY_IDX = ("دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه", "شنبه", "یکشنبه")
 
+# The group keyboard never changes, so construct it once at import time.
+_GROUP_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("🔄 بروزرسانی دستی (فقط ادمین)", callback_data='update_schedule_group')]]
+)
 def create_group_keyboard() -> InlineKeyboardMarkup:
-    keyboard = [[InlineKeyboardButton("🔄 بروزرسانی دستی (فقط ادمین)", callback_data='update_schedule_group')]]
-    return InlineKeyboardMarkup(keyboard)
-def create_private_chat_keyboard() -> InlineKeyboardMarkup:
+    return _GROUP_KEYBOARD
+@lru_cache(maxsize=2)
+def _private_chat_keyboard_for_day(today_ordinal: int) -> InlineKeyboardMarkup:
     buttons = []
-    today = date.today()
+    today = date.fromordinal(today_ordinal)
     for i in range(2):
         d = today + timedelta(days=i)
         api_date = d.strftime('%Y-%m-%d')
-        day_name = PERSIAN_WEEKDAYS.get(d.strftime('%A'))
+        day_name = PERSIAN_WEEKDAYS_BY_IDX[d.weekday()]
         jalali_date = jdatetime.date.fromgregorian(date=d)
         label_date = jalali_date.strftime("%d %B")
         full_label = f"{day_name} {label_date}"
         prefix = "امروز - " if i == 0 else "فردا - "
         buttons.append(InlineKeyboardButton(prefix + full_label, callback_data=api_date))
     return InlineKeyboardMarkup([buttons])
-
-def fetch_reservation_data(query_date: str) -> list | None:
-    api_url = f"{API_BASE_URL}?date={query_date}"
+def create_private_chat_keyboard() -> InlineKeyboardMarkup:
+    return _private_chat_keyboard_for_day(date.today().toordinal())
+
+@lru_cache(maxsize=2)
+def _persian_today_str_for_day(today_ordinal: int) -> str:
+    today_jalali = jdatetime.date.fromgregorian(date=date.fromordinal(today_ordinal))
+    return today_jalali.strftime("%A %d %B %Y")
+
+@lru_cache(maxsize=2)
+def _iso_str_for_day(today_ordinal: int) -> str:
+    return date.fromordinal(today_ordinal).strftime('%Y-%m-%d')
+def today_iso_str() -> str:
+    return _iso_str_for_day(date.today().toordinal())
+
+# In-flight API calls keyed by query_date, so concurrent requests for the
+# same date share one HTTP round-trip instead of hammering the API.
+_INFLIGHT_FETCHES: dict[str, asyncio.Future] = {}
+
+# Short-lived response cache keyed by query_date. Reservations change on the
+# order of minutes, so serving a <30s-old payload is not user-visible.
+_RESP_CACHE: dict[str, tuple[float, list]] = {}
+_RESP_CACHE_TTL_SECONDS = 30
+_RESP_CACHE_MAXSIZE = 8
+
+async def _request_reservation_data(query_date: str) -> list | None:
+    api_url = API_URL_FMT.format(query_date)
     logger.info(f"Requesting data from: {api_url}")
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
     try:
-        response = requests.get(api_url, timeout=15, headers=headers)
+        response = await HTTPX_CLIENT.get(api_url)
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return orjson.loads(response.content)
+    except (httpx.HTTPError, orjson.JSONDecodeError) as e:
         logger.error(f"API request failed: {e}")
         return None
 
-def format_schedule_message(data: list, query_date: str, auto_update=False) -> str:
+async def fetch_reservation_data(query_date: str) -> list | None:
+    cached_at, payload = _RESP_CACHE.get(query_date, (0.0, None))
+    if time.time() - cached_at < _RESP_CACHE_TTL_SECONDS:
+        return payload
+    inflight = _INFLIGHT_FETCHES.get(query_date)
+    if inflight is not None:
+        return await inflight
+    future = asyncio.get_running_loop().create_future()
+    _INFLIGHT_FETCHES[query_date] = future
+    try:
+        result = await _request_reservation_data(query_date)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    else:
+        if result is not None:
+            _RESP_CACHE[query_date] = (time.time(), result)
+            if len(_RESP_CACHE) > _RESP_CACHE_MAXSIZE:
+                del _RESP_CACHE[min(_RESP_CACHE, key=lambda d: _RESP_CACHE[d][0])]
+        future.set_result(result)
+        return result
+    finally:
+        del _INFLIGHT_FETCHES[query_date]
+        # If the owning task was cancelled mid-fetch, the future was never
+        # resolved above; cancel it so waiters don't hang forever.
+        if not future.done():
+            future.cancel()
+
+# Bounded cache of formatted message bodies, keyed by (query_date, payload hash).
+# The header carries the last-update time, so only the data-dependent body is cached.
+_SCHEDULE_BODY_CACHE: OrderedDict[tuple[str, int], str] = OrderedDict()
+_SCHEDULE_BODY_CACHE_MAXSIZE = 16
+
+@lru_cache(maxsize=8)
+def _persian_header(query_date: str) -> str:
     try:
         gregorian_dt = date.fromisoformat(query_date)
         jalali_date = jdatetime.date.fromgregorian(date=gregorian_dt)
-        persian_day_name = PERSIAN_WEEKDAYS.get(gregorian_dt.strftime('%A'))
-        persian_date_str = f"{persian_day_name} {jalali_date.strftime('%d %B %Y')}"
+        persian_day_name = PERSIAN_WEEKDAYS_BY_IDX[gregorian_dt.weekday()]
+        return f"{persian_day_name} {jalali_date.strftime('%d %B %Y')}"
     except (ValueError, ImportError):
-        persian_date_str = query_date
-    
-    last_update_time = jdatetime.datetime.now().strftime('%H:%M')
-    update_info = f"*(بروزرسانی خودکار هر {int(AUTO_UPDATE_INTERVAL_SECONDS/60)} دقیقه - آخرین آپدیت: {last_update_time})*\n\n"
-    
-    message_header = f"📅 **تایم‌های امروز ({persian_date_str})**\n\n{update_info}"
+        return query_date
+
+def _schedule_body(data: list, query_date: str) -> str:
+    cache_key = (query_date, hash(json.dumps(data, sort_keys=True)))
+    cached_body = _SCHEDULE_BODY_CACHE.get(cache_key)
+    if cached_body is not None:
+        _SCHEDULE_BODY_CACHE.move_to_end(cache_key)
+        return cached_body
 
     if not data:
-        return message_header + "😕 در حال حاضر هیچ تایم قابل رزروی برای امروز ثبت نشده است."
-
-    message_body = ""
-    for court_data in data:
-        court_name = court_data.get('court', {}).get('name', 'زمین نامشخص')
-        message_body += f"🎾 **زمین: {court_name}**\n"
-        time_slots = court_data.get('time_slots', [])
-        if not time_slots:
-            message_body += "هیچ سانسی برای این زمین وجود ندارد.\n"
-        else:
-            for slot in time_slots:
-                start_time = slot.get('start_time', 'N/A')
-                if slot.get('is_available', False):
-                    message_body += f"✅ `{start_time}` - قابل رزرو\n"
-                else:
-                    user_name = slot.get('user', {}).get('full_name', 'شخصی')
-                    message_body += f"❌ `{start_time}` - رزرو شده توسط {user_name}\n"
-        message_body += "\n"
-        
-    return message_header + message_body
+        message_body = "😕 در حال حاضر هیچ تایم قابل رزروی برای امروز ثبت نشده است."
+    else:
+        parts = []
+        for court_data in data:
+            court_name = court_data.get('court', {}).get('name', 'زمین نامشخص')
+            parts.append(f"🎾 **زمین: {court_name}**\n")
+            time_slots = court_data.get('time_slots', [])
+            if not time_slots:
+                parts.append("هیچ سانسی برای این زمین وجود ندارد.\n")
+            else:
+                for slot in time_slots:
+                    start_time = slot.get('start_time', 'N/A')
+                    if slot.get('is_available', False):
+                        parts.append(f"✅ `{start_time}` - قابل رزرو\n")
+                    else:
+                        user_name = slot.get('user', {}).get('full_name', 'شخصی')
+                        parts.append(f"❌ `{start_time}` - رزرو شده توسط {user_name}\n")
+            parts.append("\n")
+        message_body = "".join(parts)
+
+    _SCHEDULE_BODY_CACHE[cache_key] = message_body
+    if len(_SCHEDULE_BODY_CACHE) > _SCHEDULE_BODY_CACHE_MAXSIZE:
+        _SCHEDULE_BODY_CACHE.popitem(last=False)
+    return message_body
 
+def format_schedule_message(data: list, query_date: str, auto_update=False) -> str:
+    persian_date_str = _persian_header(query_date)
+
+    last_update_time = jdatetime.datetime.now().strftime('%H:%M')
+    update_info = _UPDATE_INFO_TEMPLATE.format(last_update_time)
+
+    message_header = f"📅 **تایم‌های امروز ({persian_date_str})**\n\n{update_info}"
+    return message_header + _schedule_body(data, query_date)
+
+
+# Last schedule body sent per group chat, used to skip no-op edits locally
+# instead of letting Telegram reject them with "message is not modified".
+# Bodies are compared rather than full texts because the header embeds the
+# last-update clock time, which changes every tick.
+_GROUP_LAST_BODY: dict[int, str] = {}
+
+# Button cooldowns and the manual-click counter are ephemeral, so they live
+# in memory instead of costing fsync'd SQLite writes on every press. Clicks
+# are flushed to the stats table once a minute (and on shutdown) so /stats
+# still survives restarts.
+_COOLDOWNS: dict[int, float] = {}
+_PENDING_CLICKS = 0
+
+# Admin ids per group chat with a short TTL; group admins change rarely, so
+# one get_chat_administrators call per chat per interval replaces a
+# get_chat_member round-trip on every button press.
+_CHAT_ADMIN_CACHE: dict[int, tuple[float, set[int]]] = {}
+_CHAT_ADMIN_CACHE_TTL_SECONDS = 300
+
+async def _is_chat_admin(bot, chat_id: int, user_id: int) -> bool:
+    cached = _CHAT_ADMIN_CACHE.get(chat_id)
+    if cached is not None and time.time() - cached[0] < _CHAT_ADMIN_CACHE_TTL_SECONDS:
+        return user_id in cached[1]
+    admins = await bot.get_chat_administrators(chat_id)
+    admin_ids = {member.user.id for member in admins}
+    _CHAT_ADMIN_CACHE[chat_id] = (time.time(), admin_ids)
+    return user_id in admin_ids
 
 # --- TELEGRAM HANDLERS ---
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -201,20 +341,10 @@ async def setup_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await update.message.reply_text("این دستور فقط در گروه‌ها قابل استفاده است.")
         return
         
-    today_gregorian_str = date.today().strftime('%Y-%m-%d')
-    today_jalali = jdatetime.date.fromgregorian(date=date.today())
-    today_persian_str = today_jalali.strftime("%A %d %B %Y")
+    today_gregorian_str = today_iso_str()
+    today_persian_str = _persian_today_str_for_day(date.today().toordinal())
     
-    group_welcome_message = (
-        f"🎾 **آکادمی تنیس آرسس (بروزرسانی {today_persian_str})**\n\n"
-        "به گروه اطلاع‌رسانی تایم‌های آزاد خوش آمدید.\n\n"
-        f"👇 **مهم:** لیست تایم‌ها در پیام زیر به صورت خودکار هر **{int(AUTO_UPDATE_INTERVAL_SECONDS/60)} دقیقه** بروزرسانی می‌شود.\n\n"
-        "🌐 **وب‌سایت:** [arsestennis.ir](http://arsestennis.ir)\n"
-        "📅 **رزرو آنلاین:** [arsestennis.ir/reservations/reserve-for-today](http://arsestennis.ir/reservations/reserve-for-today/)\n\n"
-        "📞 **تماس جهت هماهنگی:**\n"
-        f"▪️ **{STAFF_NAME}:** [{STAFF_PHONE}](tel:+98{STAFF_PHONE[1:]})\n"
-        f"▪️ **{MANAGER_NAME}:** [{MANAGER_PHONE}](tel:+98{MANAGER_PHONE[1:]})"
-    )
+    group_welcome_message = _GROUP_WELCOME_TEMPLATE.format(today_persian_str)
     reply_markup = create_group_keyboard()
     
     # NEW: Check if a video ID is configured and send it, otherwise send text.
@@ -231,7 +361,7 @@ async def setup_group(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             chat_id=chat.id, text=group_welcome_message, reply_markup=reply_markup, parse_mode='Markdown'
         )
     
-    reservation_data = fetch_reservation_data(today_gregorian_str)
+    reservation_data = await fetch_reservation_data(today_gregorian_str)
     schedule_text = format_schedule_message(reservation_data, today_gregorian_str)
     schedule_message = await context.bot.send_message(
         chat_id=chat.id, text=schedule_text, parse_mode='Markdown'
@@ -248,54 +378,72 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     if chat_type in [ChatType.GROUP, ChatType.SUPERGROUP] and query.data == 'update_schedule_group':
         user_id = query.from_user.id
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        if member.status not in ['administrator', 'creator']:
+        if not await _is_chat_admin(context.bot, chat_id, user_id):
             await query.answer("این دکمه فقط برای ادمین‌ها فعال است.", show_alert=True)
             return
 
         current_time = time.time()
-        if current_time - db_get_cooldown(chat_id) < BUTTON_COOLDOWN_SECONDS:
+        if current_time - _COOLDOWNS.get(chat_id, 0.0) < BUTTON_COOLDOWN_SECONDS:
             await query.answer("لطفا چند لحظه صبر کنید.", show_alert=True)
             return
-        db_set_cooldown(chat_id, current_time)
-        db_increment_stat('updates_clicked')
+        _COOLDOWNS[chat_id] = current_time
+        global _PENDING_CLICKS
+        _PENDING_CLICKS += 1
 
         message_id_to_edit = db_get_schedule_message(chat_id)
         if not message_id_to_edit:
             await query.answer("خطا: پیام اصلی پیدا نشد. لطفا از ادمین بخواهید دوباره از دستور /setupgroup استفاده کند.", show_alert=True)
             return
 
-        today_str = date.today().strftime('%Y-%m-%d')
-        new_data = fetch_reservation_data(today_str)
-        new_text = format_schedule_message(new_data, today_str)
+        today_str = today_iso_str()
+        new_data = await fetch_reservation_data(today_str)
+        new_body = _schedule_body(new_data, today_str)
 
+        if new_body == _GROUP_LAST_BODY.get(chat_id):
+            await query.answer("تایم‌ها تغییری نکرده‌اند.", show_alert=True)
+            return
+
+        new_text = format_schedule_message(new_data, today_str)
         try:
             await context.bot.edit_message_text(
                 chat_id=chat_id, message_id=message_id_to_edit, text=new_text, parse_mode='Markdown'
             )
-        except BadRequest:
-            logger.warning(f"Could not find message {message_id_to_edit}. Recreating.")
-            new_msg = await context.bot.send_message(chat_id=chat_id, text=new_text, parse_mode='Markdown')
-            db_set_schedule_message(chat_id, new_msg.message_id)
+            _GROUP_LAST_BODY[chat_id] = new_body
+        except BadRequest as e:
+            if e.message.startswith('Message is not modified'):
+                _GROUP_LAST_BODY[chat_id] = new_body
+            elif e.message == 'Message to edit not found':
+                logger.warning(f"Could not find message {message_id_to_edit}. Recreating.")
+                new_msg = await context.bot.send_message(chat_id=chat_id, text=new_text, parse_mode='Markdown')
+                db_set_schedule_message(chat_id, new_msg.message_id)
+                _GROUP_LAST_BODY[chat_id] = new_body
+            else:
+                logger.error(f"Manual update failed for group {chat_id}: {e}")
         return
 
     elif chat_type == ChatType.PRIVATE:
         query_date = query.data
         await query.edit_message_text(text=f"لطفا صبر کنید، در حال دریافت برنامه برای تاریخ {query_date}...")
-        reservation_data = fetch_reservation_data(query_date)
+        reservation_data = await fetch_reservation_data(query_date)
         message_text = format_schedule_message(reservation_data, query_date)
         await query.edit_message_text(text=message_text, parse_mode='Markdown')
         await context.bot.send_message(
             chat_id=chat_id, text="می‌توانید روز دیگری را انتخاب کنید:", reply_markup=create_private_chat_keyboard()
         )
 
+_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_FA_TO_ASCII_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹', '0123456789')
+
 async def date_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.effective_chat.type != ChatType.PRIVATE: return
-    user_input_date = update.message.text
+    user_input_date = update.message.text.strip().translate(_FA_TO_ASCII_DIGITS)
+    if not _DATE_RE.match(user_input_date):
+        await update.message.reply_text("متاسفم، فرمت قابل فهم نیست. لطفا تاریخ را به صورت `YYYY-MM-DD` ارسال کنید.")
+        return
     try:
         date.fromisoformat(user_input_date)
         await update.message.reply_text(f"دریافت شد! در حال دریافت برنامه برای تاریخ {user_input_date}...")
-        reservation_data = fetch_reservation_data(user_input_date)
+        reservation_data = await fetch_reservation_data(user_input_date)
         message_text = format_schedule_message(reservation_data, user_input_date)
         await update.message.reply_text(text=message_text, parse_mode='Markdown')
         await context.bot.send_message(
@@ -312,7 +460,7 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 @admin_only
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    updates_clicked = db_get_stat('updates_clicked')
+    updates_clicked = db_get_stat('updates_clicked') + _PENDING_CLICKS
     auto_updates = db_get_stat('auto_updates_processed')
     await update.message.reply_text(f"📈 **آمار استفاده ربات:**\n\n- بروزرسانی دستی (ادمین): {updates_clicked} بار\n- بروزرسانی خودکار: {auto_updates} بار")
 
@@ -323,54 +471,129 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("⚠️ لطفا متن پیام خود را بعد از دستور وارد کنید.\nمثال: `/broadcast سلام به همه!`")
         return
     active_groups = db_get_all_active_groups()
-    successful_sends, failed_sends = 0, 0
     await update.message.reply_text(f"📣 در حال ارسال پیام شما به {len(active_groups)} گروه...")
-    for chat_id in active_groups:
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=message_to_broadcast)
-            successful_sends += 1
-        except (Forbidden, BadRequest):
-            logger.warning(f"Could not send broadcast to group {chat_id}.")
-            db_remove_schedule_message(chat_id)
-            failed_sends += 1
+
+    # Bounded fan-out; the sleep below paces each slot so the combined rate
+    # stays near 25 msg/s, under Telegram's ~30 msg/s bulk limit. Transient
+    # failures (flood limit, timeout) count as failed sends but do NOT remove
+    # the group from the DB — only Forbidden/BadRequest mean it is unreachable.
+    semaphore = asyncio.Semaphore(25)
+    unreachable_ids: list[int] = []
+
+    async def _send_one(chat_id: int) -> bool:
+        async with semaphore:
+            try:
+                await context.bot.send_message(chat_id=chat_id, text=message_to_broadcast)
+                return True
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                try:
+                    await context.bot.send_message(chat_id=chat_id, text=message_to_broadcast)
+                    return True
+                except (Forbidden, BadRequest):
+                    logger.warning(f"Could not send broadcast to group {chat_id}.")
+                    unreachable_ids.append(chat_id)
+                except (RetryAfter, TimedOut):
+                    logger.warning(f"Broadcast to group {chat_id} still rate-limited after retry.")
+            except TimedOut:
+                logger.warning(f"Broadcast to group {chat_id} timed out.")
+            except (Forbidden, BadRequest):
+                logger.warning(f"Could not send broadcast to group {chat_id}.")
+                unreachable_ids.append(chat_id)
+            finally:
+                await asyncio.sleep(1 / 25)
+            return False
+
+    results = await asyncio.gather(*map(_send_one, active_groups), return_exceptions=True)
+    for chat_id, result in zip(active_groups, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Broadcast to group {chat_id} failed: {result}")
+    successful_sends = sum(result is True for result in results)
+    failed_sends = len(active_groups) - successful_sends
+    db_remove_schedule_messages(unreachable_ids)
     await update.message.reply_text(f"✅ پیام با موفقیت به {successful_sends} گروه ارسال شد.\n❌ در {failed_sends} گروه ارسال ناموفق بود.")
 
 async def auto_update_schedules(context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info("Running scheduled auto-update job...")
-    today_str = date.today().strftime('%Y-%m-%d')
-    active_groups = db_get_all_active_groups()
+    today_str = today_iso_str()
+    schedules = db_get_all_schedules()
 
-    if not active_groups:
+    if not schedules:
         logger.info("Auto-update job finished: No active groups to update.")
         return
 
-    new_data = fetch_reservation_data(today_str)
-    
-    for chat_id in active_groups:
-        message_id = db_get_schedule_message(chat_id)
-        if not message_id:
-            continue
+    new_data = await fetch_reservation_data(today_str)
+    new_body = _schedule_body(new_data, today_str)
+    new_text = format_schedule_message(new_data, today_str, auto_update=True)
+
+    # Edits run concurrently; the semaphore keeps us under Telegram's
+    # ~30 msg/s global limit so we don't trade latency for RetryAfter errors.
+    semaphore = asyncio.Semaphore(20)
+
+    async def _edit_one(chat_id: int, message_id: int) -> bool:
+        if _GROUP_LAST_BODY.get(chat_id) == new_body:
+            return False
+        async with semaphore:
+            try:
+                await context.bot.edit_message_text(
+                    chat_id=chat_id, message_id=message_id, text=new_text, parse_mode='Markdown'
+                )
+                _GROUP_LAST_BODY[chat_id] = new_body
+                return True
+            except Forbidden:
+                logger.warning(f"Auto-update failed for group {chat_id}: Bot is no longer an admin or was kicked. Removing from DB.")
+                db_remove_schedule_message(chat_id)
+            except BadRequest as e:
+                if e.message == 'Message to edit not found':
+                    logger.warning(f"Auto-update failed for group {chat_id}: Original message not found. Recreating.")
+                    new_msg = await context.bot.send_message(chat_id=chat_id, text=new_text, parse_mode='Markdown')
+                    db_set_schedule_message(chat_id, new_msg.message_id)
+                    _GROUP_LAST_BODY[chat_id] = new_body
+                elif not e.message.startswith('Message is not modified'):
+                    logger.error(f"An unexpected BadRequest occurred during auto-update for group {chat_id}: {e}")
+            return False
+
+    results = await asyncio.gather(
+        *(_edit_one(chat_id, message_id) for chat_id, message_id in schedules),
+        return_exceptions=True
+    )
+    for (chat_id, _), result in zip(schedules, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Auto-update failed for group {chat_id}: {result}")
+    db_add_stat('auto_updates_processed', sum(result is True for result in results))
+    logger.info(f"Auto-update job finished. Processed {len(schedules)} groups.")
 
-        new_text = format_schedule_message(new_data, today_str, auto_update=True)
-        try:
-            await context.bot.edit_message_text(
-                chat_id=chat_id, message_id=message_id, text=new_text, parse_mode='Markdown'
-            )
-            db_increment_stat('auto_updates_processed')
-        except Forbidden:
-            logger.warning(f"Auto-update failed for group {chat_id}: Bot is no longer an admin or was kicked. Removing from DB.")
-            db_remove_schedule_message(chat_id)
-        except BadRequest as e:
-            if "message to edit not found" in str(e).lower():
-                logger.warning(f"Auto-update failed for group {chat_id}: Original message not found. Recreating.")
-                new_msg = await context.bot.send_message(chat_id=chat_id, text=new_text, parse_mode='Markdown')
-                db_set_schedule_message(chat_id, new_msg.message_id)
-            elif "message is not modified" not in str(e).lower():
-                 logger.error(f"An unexpected BadRequest occurred during auto-update for group {chat_id}: {e}")
+def _flush_pending_clicks() -> None:
+    global _PENDING_CLICKS
+    if _PENDING_CLICKS:
+        db_add_stat('updates_clicked', _PENDING_CLICKS)
+        _PENDING_CLICKS = 0
 
-    logger.info(f"Auto-update job finished. Processed {len(active_groups)} groups.")
+async def flush_stats_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    _flush_pending_clicks()
+
+async def wal_checkpoint_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Periodically folds the WAL back into the main DB file."""
+    _db().execute("PRAGMA wal_checkpoint(PASSIVE)")
 
 # --- MAIN APPLICATION SETUP ---
+async def post_init(application: Application) -> None:
+    """Creates the shared HTTP client once the bot's event loop is running."""
+    global HTTPX_CLIENT
+    HTTPX_CLIENT = httpx.AsyncClient(
+        timeout=15,
+        headers={'User-Agent': USER_AGENT},
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+    )
+
+async def post_shutdown(application: Application) -> None:
+    """Closes the shared HTTP client when the bot shuts down."""
+    if HTTPX_CLIENT is not None:
+        await HTTPX_CLIENT.aclose()
+    _flush_pending_clicks()
+    _db().execute("PRAGMA optimize")
+    _db().close()
+
 def main() -> None:
     """Starts the Telegram bot."""
     if not TELEGRAM_BOT_TOKEN:
@@ -380,13 +603,15 @@ def main() -> None:
         logger.warning("Warning: ADMIN_IDS are not set in the environment variables. Admin commands will not work.")
 
     init_db()
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     application.job_queue.run_repeating(
         auto_update_schedules,
         interval=AUTO_UPDATE_INTERVAL_SECONDS,
         first=10
     )
+    application.job_queue.run_repeating(flush_stats_job, interval=60, first=60)
+    application.job_queue.run_repeating(wal_checkpoint_job, interval=3600, first=3600)
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("setupgroup", setup_group))
@@ -398,7 +623,15 @@ def main() -> None:
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, date_message_handler))
 
     logger.info("Starting bot v3.0.4...")
-    application.run_polling()
+    if PUBLIC_URL:
+        application.run_webhook(
+            listen='0.0.0.0',
+            port=WEBHOOK_PORT,
+            url_path=TELEGRAM_BOT_TOKEN,
+            webhook_url=f"{PUBLIC_URL}/{TELEGRAM_BOT_TOKEN}"
+        )
+    else:
+        application.run_polling(timeout=30, poll_interval=0.0)
 
 if __name__ == '__main__':
     main()